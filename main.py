@@ -47,6 +47,7 @@ if __name__ == "__main__":
     postprocess = PostProcess(
         confidence_threshold=training_cfg["confidence_threshold"],
         iou_threshold=training_cfg["iou_threshold"],
+        max_candidates=training_cfg["nms_max_candidates"],
     )
 
     # optimizer = torch.optim.AdamW(
@@ -74,9 +75,9 @@ if __name__ == "__main__":
             optimizer.zero_grad()
             for example in examples:
                 # Prep inputs
-                image = example["image"].to(device).unsqueeze(0)
-                labels = example["labels"].to(device).unsqueeze(0)
-                boxes = example["boxes"].to(device).unsqueeze(0)
+                image = example["image"].to(device, non_blocking=True).unsqueeze(0)
+                labels = example["labels"].to(device, non_blocking=True).unsqueeze(0)
+                boxes = example["boxes"].to(device, non_blocking=True).unsqueeze(0)
                 boxes = coco_to_model_input(boxes, example["meta"]).to(device)
 
                 # Predict
@@ -106,9 +107,11 @@ if __name__ == "__main__":
             for i, examples in enumerate(tqdm(test_dataloader, ncols=60)):
                 for example in examples:
                     # Prep inputs
-                    image = example["image"].to(device).unsqueeze(0)
-                    labels = example["labels"].to(device).unsqueeze(0)
-                    boxes = example["boxes"].to(device).unsqueeze(0)
+                    image = example["image"].to(device, non_blocking=True).unsqueeze(0)
+                    labels = (
+                        example["labels"].to(device, non_blocking=True).unsqueeze(0)
+                    )
+                    boxes = example["boxes"].to(device, non_blocking=True).unsqueeze(0)
                     metadata = example["meta"]
                     boxes = coco_to_model_input(boxes, metadata).to(device)
 
@@ -61,9 +61,15 @@ def get_dataloaders(
         shuffle=True,
         num_workers=4,
         collate_fn=collate,
+        pin_memory=True,
     )
     test_dataloader = DataLoader(
-        test_dataset, batch_size=1, shuffle=False, num_workers=4, collate_fn=collate
+        test_dataset,
+        batch_size=1,
+        shuffle=False,
+        num_workers=4,
+        collate_fn=collate,
+        pin_memory=True,
     )
 
     return train_dataloader, test_dataloader, scales, labelmap
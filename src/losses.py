@@ -39,14 +39,13 @@ class CombinedLoss(torch.nn.Module):
         (DETR box loss)
 
         Compute the losses related to the bounding boxes, the L1 regression loss and the GIoU loss
-        targets dicts must contain the key "boxes" containing a tensor of dim [nb_target_boxes, 4]
+        targets must contain the key "boxes" containing the batch's concatenated boxes [sum(sizes), 4]
         The target boxes are expected in format (center_x, center_y, w, h), normalized by the image size.
         """
         assert "pred_boxes" in outputs
         src_boxes = outputs["pred_boxes"][idx]
-        target_boxes = torch.cat(
-            [t["boxes"][i] for t, (_, i) in zip(targets, indices)], dim=0
-        )
+        _, tgt_idx = indices
+        target_boxes = targets["boxes"][tgt_idx]
         loss_bbox = torch.nn.functional.l1_loss(
             src_boxes, target_boxes, reduction="none"
         )
@@ -74,10 +73,13 @@ class CombinedLoss(torch.nn.Module):
             "pred_boxes": predicted_boxes,
         }
 
-        in_targets = [
-            {"labels": _labels, "boxes": _boxes}
-            for _boxes, _labels in zip(target_boxes, target_classes)
-        ]
+        # main.py passes one unpadded example per call ([1, n]), so flattening
+        # concatenates the targets and every row is a real target
+        in_targets = {
+            "labels": target_classes.flatten(0, 1),
+            "boxes": target_boxes.flatten(0, 1),
+            "sizes": [target_classes.shape[1]] * target_classes.shape[0],
+        }
         target_classes, indices, idx = self.matcher(in_preds, in_targets)
 
         loss_bbox, loss_giou = self.loss_boxes(
@@ -85,7 +87,7 @@ class CombinedLoss(torch.nn.Module):
             in_targets,
             indices,
             idx,
-            num_boxes=sum(len(t["labels"]) for t in in_targets),
+            num_boxes=len(in_targets["labels"]),
         )
 
         for box, label in zip(predicted_boxes[0], target_classes[0]):
@@ -0,0 +1,246 @@
+"""
+Adapted from DETR's matcher and box ops
+(https://github.com/facebookresearch/detr/blob/main/models/matcher.py)
+"""
+
+import os
+
+import numpy as np
+import torch
+from scipy.optimize import linear_sum_assignment
+from torchvision.ops.boxes import box_area
+
+from src import numba_lapjv
+
+# The numba solver beats scipy once the smaller side of the cost matrix has at
+# least this many entries. Below it scipy's lower call overhead wins
+NUMBA_MIN_SIDE = 5
+
+# Checking for degenerate boxes costs two reductions and a device sync per call,
+# so it's opt-in for debugging
+VALIDATE_BOXES = os.environ.get("OWL_VALIDATE_BOXES", "0") == "1"
+
+
+def box_iou(boxes1, boxes2):
+    area1 = box_area(boxes1)
+    area2 = box_area(boxes2)
+
+    lt = torch.max(boxes1[:, None, :2], boxes2[:, :2])  # [N,M,2]
+    rb = torch.min(boxes1[:, None, 2:], boxes2[:, 2:])  # [N,M,2]
+
+    wh = (rb - lt).clamp(min=0)  # [N,M,2]
+    inter = wh[:, :, 0] * wh[:, :, 1]  # [N,M]
+
+    union = area1[:, None] + area2 - inter
+
+    iou = inter / union
+    return iou, union
+
+
+@torch.jit.script
+def generalized_box_iou_fused(boxes1, boxes2):
+    """
+    Single pass version of generalized_box_iou. The intersection and
+    enclosing box extents are computed from the same broadcast so the
+    [N,M,2] intermediates aren't built twice, and scripting lets the
+    elementwise ops fuse.
+    """
+    # Areas come from the same coordinates as everything else rather than
+    # another pass through box_area
+    b1 = boxes1[:, None, :]  # [N,1,4]
+    area1 = (b1[..., 2] - b1[..., 0]) * (b1[..., 3] - b1[..., 1])  # [N,1]
+    area2 = (boxes2[..., 2] - boxes2[..., 0]) * (boxes2[..., 3] - boxes2[..., 1])  # [M]
+    inter_wh = torch.min(b1[..., 2:], boxes2[..., 2:]) - torch.max(
+        b1[..., :2], boxes2[..., :2]
+    )
+    inter_wh = inter_wh.clamp_min(0)  # [N,M,2]
+    outer_wh = torch.max(b1[..., 2:], boxes2[..., 2:]) - torch.min(
+        b1[..., :2], boxes2[..., :2]
+    )  # [N,M,2]
+
+    inter = inter_wh[..., 0] * inter_wh[..., 1]
+    outer_area = outer_wh[..., 0] * outer_wh[..., 1]
+    union = area1 + area2 - inter
+
+    return inter / union - (outer_area - union) / outer_area
+
+
+@torch.jit.script
+def pairwise_l1(boxes1, boxes2):
+    """
+    Equivalent to torch.cdist(boxes1, boxes2, p=1). For a 4-d inner dim the
+    broadcast sub/abs/sum is a single pass and skips cdist's temporaries.
+    """
+    return (boxes1.unsqueeze(1) - boxes2.unsqueeze(0)).abs_().sum(-1)
+
+
+@torch.jit.script
+def assemble_cost(
+    out_logits,
+    out_bbox,
+    tgt_ids,
+    tgt_bbox,
+    w_class: float,
+    w_bbox: float,
+    w_giou: float,
+):
+    """
+    The matcher's weighted [BQ, T] cost in one scripted function so the
+    weighting and sum fuse into a single pass over the three components
+    """
+    # Approximate 1 - proba[target class], the 1 is a constant that doesn't change the matching.
+    # Only the target columns are needed, so skip materializing the full softmax
+    lse = torch.logsumexp(out_logits, dim=-1, keepdim=True)
+    cost_class = -(out_logits.index_select(1, tgt_ids) - lse).exp()
+    cost_bbox = pairwise_l1(out_bbox, tgt_bbox)
+    cost_giou = -generalized_box_iou_fused(out_bbox, tgt_bbox)
+    return w_bbox * cost_bbox + w_class * cost_class + w_giou * cost_giou
+
+
+def _assert_valid_boxes(boxes):
+    assert (boxes[:, 2:] >= boxes[:, :2]).all()
+
+
+def generalized_box_iou(boxes1, boxes2):
+    """
+    Generalized IoU from https://giou.stanford.edu/
+
+    The boxes should be in [x0, y0, x1, y1] format
+
+    Returns a [N, M] pairwise matrix, where N = len(boxes1)
+    and M = len(boxes2)
+    """
+    # degenerate boxes gives inf / nan results
+    # so check early when debugging
+    if VALIDATE_BOXES:
+        _assert_valid_boxes(boxes1)
+        _assert_valid_boxes(boxes2)
+    return generalized_box_iou_fused(boxes1, boxes2)
+
+
+def solve_assignment(cost):
+    """
+    Same contract as scipy's linear_sum_assignment: returns (row_ind, col_ind)
+    with row_ind sorted. Matrices with at least NUMBA_MIN_SIDE targets go to
+    the numba solver when it's installed, everything else uses scipy.
+    """
+    if numba_lapjv.available and min(cost.shape) >= NUMBA_MIN_SIDE:
+        return numba_lapjv.linear_sum_assignment(cost)
+
+    return linear_sum_assignment(cost)
+
+
+class HungarianMatcher(torch.nn.Module):
+    """This class computes an assignment between the targets and the predictions of the network
+
+    For efficiency reasons, the targets don't include the no_object. Because of this, in general,
+    there are more predictions than targets. In this case, we do a 1-to-1 matching of the best predictions,
+    while the others are un-matched (and thus treated as non-objects).
+    """
+
+    def __init__(self, n_classes, cost_class=1, cost_bbox=1, cost_giou=1):
+        super().__init__()
+        self.n_classes = n_classes
+        self.cost_class = cost_class
+        self.cost_bbox = cost_bbox
+        self.cost_giou = cost_giou
+        assert (
+            cost_class != 0 or cost_bbox != 0 or cost_giou != 0
+        ), "all costs cant be 0"
+
+    @staticmethod
+    def _host_cost_matrices(C, sizes):
+        """
+        Yields the per-image [num_queries, num_targets] cost matrices as numpy
+        arrays. On cuda all of the device->host copies are queued up front into
+        pinned memory, so later copies overlap with solving earlier images.
+        The copies keep C's dtype and the float64 cast the solvers want
+        happens on the host, so the transfer isn't doubled.
+        """
+        if not C.is_cuda:
+            C = C.numpy()
+            offsets = np.cumsum([0] + sizes)
+            for i in range(len(sizes)):
+                yield C[i, :, offsets[i] : offsets[i + 1]].astype(np.float64)
+            return
+
+        copies = []
+        for i, c in enumerate(C.split(sizes, -1)):
+            host = torch.empty(c.shape[1:], dtype=c.dtype, pin_memory=True)
+            host.copy_(c[i], non_blocking=True)
+            done = torch.cuda.Event()
+            done.record()
+            copies.append((host, done))
+
+        for host, done in copies:
+            done.synchronize()
+            yield host.numpy().astype(np.float64)
+
+    @torch.no_grad()
+    def forward(self, outputs, targets):
+        """
+        outputs: dict with "pred_logits" [batch_size, num_queries, num_classes]
+            and "pred_boxes" [batch_size, num_queries, 4]
+        targets: dict with the batch's targets already concatenated, "labels"
+            [sum(sizes)], "boxes" [sum(sizes), 4] and "sizes", the number of
+            targets per image
+
+        Returns the per-query target classes (background = n_classes), the
+        matches as flat (src_idx, tgt_idx) where src_idx indexes each image's
+        queries and tgt_idx indexes the concatenated targets, and the
+        (batch_idx, src_idx) index into the predictions
+        """
+        bs, num_queries = outputs["pred_logits"].shape[:2]
+
+        # We flatten to compute the cost matrices in a batch
+        out_logits = outputs["pred_logits"].flatten(0, 1)
+        out_bbox = outputs["pred_boxes"].flatten(0, 1)
+
+        tgt_ids = targets["labels"]
+        tgt_bbox = targets["boxes"]
+        sizes = targets["sizes"]
+
+        if VALIDATE_BOXES:
+            _assert_valid_boxes(out_bbox)
+            _assert_valid_boxes(tgt_bbox)
+
+        C = assemble_cost(
+            out_logits,
+            out_bbox,
+            tgt_ids,
+            tgt_bbox,
+            float(self.cost_class),
+            float(self.cost_bbox),
+            float(self.cost_giou),
+        )
+        C = C.view(bs, num_queries, -1)
+
+        indices = [solve_assignment(c) for c in self._host_cost_matrices(C, sizes)]
+        # Flatten the per-image solutions once instead of building a tensor pair per image
+        src_idx = torch.from_numpy(
+            np.concatenate([i for i, _ in indices]).astype(np.int64, copy=False)
+        )
+        tgt_idx = torch.from_numpy(
+            np.concatenate([j for _, j in indices]).astype(np.int64, copy=False)
+        )
+        counts = [len(i) for i, _ in indices]
+
+        batch_idx = torch.repeat_interleave(torch.arange(bs), torch.as_tensor(counts))
+
+        # tgt_idx is per image, shift it into the concatenated targets
+        tgt_offsets = torch.as_tensor(np.cumsum([0] + sizes[:-1]))
+        tgt_idx = tgt_idx + tgt_offsets[batch_idx]
+        target_classes_o = tgt_ids[tgt_idx]
+
+        indices = (src_idx, tgt_idx)
+        idx = (batch_idx, src_idx)
+
+        target_classes = torch.full(
+            (bs, num_queries),
+            self.n_classes,
+            dtype=torch.int64,
+            device=target_classes_o.device,
+        )
+        target_classes[idx] = target_classes_o
+
+        return target_classes, indices, idx
@@ -1,10 +1,27 @@
 import os
+from math import isqrt
 
-import numpy as np
 import torch
 from torchvision.ops import batched_nms
 from transformers import OwlViTForObjectDetection
-from transformers.image_transforms import center_to_corners_format
+
+
+@torch.jit.script
+def _fused_class_multiply_ln(x, weight, bias, eps: float):
+    # Multiplies the patch tokens by the class token and layernorms the
+    # result in one scripted function so the product doesn't round trip
+    patches = x[:, 1:, :] * x[:, :1, :]
+    return torch.nn.functional.layer_norm(
+        patches, [patches.size(-1)], weight, bias, eps
+    )
+
+
+@torch.jit.script
+def _fused_box_post(pred, bias):
+    # Box bias, sigmoid and center_to_corners_format in one scripted function
+    p = torch.sigmoid(pred + bias)
+    cx, cy, w, h = p.unbind(-1)
+    return torch.stack([cx - 0.5 * w, cy - 0.5 * h, cx + 0.5 * w, cy + 0.5 * h], -1)
 
 
 class OwlViT(torch.nn.Module):
@@ -20,9 +37,14 @@ class OwlViT(torch.nn.Module):
         # Take the pretrained components that are useful to us
         self.backbone = pretrained_model.owlvit.vision_model
         self.post_post_layernorm = pretrained_model.layer_norm
+        self.post_post_layernorm_eps = float(self.post_post_layernorm.eps)
         self.box_head = pretrained_model.box_head
         self.compute_box_bias = pretrained_model.compute_box_bias
-        self.sigmoid = pretrained_model.sigmoid
+
+        # compute_box_bias only depends on the patch grid, not on any weights,
+        # so it's cached and only recomputed when the grid or device changes
+        self._box_bias = None
+        self._box_bias_key = None
 
         # The custom part
         self.class_predictor = torch.nn.Sequential(
@@ -33,6 +55,17 @@ class OwlViT(torch.nn.Module):
             torch.nn.Linear(768, n_classes),
         )
 
+        # These are a lot of small ops, compiling fuses them. forward stays eager.
+        self.image_embedder = torch.compile(self.image_embedder, fullgraph=False)
+        self.box_predictor = torch.compile(self.box_predictor, fullgraph=False)
+
+    def box_bias(self, feature_map: torch.FloatTensor) -> torch.FloatTensor:
+        key = (feature_map.shape[1:3], feature_map.device)
+        if self._box_bias_key != key:
+            self._box_bias = self.compute_box_bias(feature_map)
+            self._box_bias_key = key
+        return self._box_bias
+
     # Copied from transformers.models.clip.modeling_owlvit.OwlViTForObjectDetection.box_predictor
     # Removed some comments and docstring to clear up clutter
     def box_predictor(
@@ -41,9 +74,7 @@ class OwlViT(torch.nn.Module):
         feature_map: torch.FloatTensor,
     ) -> torch.FloatTensor:
         pred_boxes = self.box_head(image_feats)
-        pred_boxes += self.compute_box_bias(feature_map)
-        pred_boxes = self.sigmoid(pred_boxes)
-        return center_to_corners_format(pred_boxes)
+        return _fused_box_post(pred_boxes, self.box_bias(feature_map))
 
     # Copied from transformers.models.clip.modeling_owlvit.OwlViTForObjectDetection.image_embedder
     # Removed some comments and docstring to clear up clutter for now
@@ -51,18 +82,16 @@ class OwlViT(torch.nn.Module):
         vision_outputs = self.backbone(pixel_values=pixel_values).last_hidden_state
         image_embeds = self.backbone.post_layernorm(vision_outputs)
 
-        new_size = tuple(np.array(image_embeds.shape) - np.array((0, 1, 0)))
-        class_token_out = torch.broadcast_to(image_embeds[:, :1, :], new_size)
-
-        image_embeds = image_embeds[:, 1:, :] * class_token_out
-        image_embeds = self.post_post_layernorm(image_embeds)
-
-        new_size = (
-            image_embeds.shape[0],
-            int(np.sqrt(image_embeds.shape[1])),
-            int(np.sqrt(image_embeds.shape[1])),
-            image_embeds.shape[-1],
+        b, s, d = image_embeds.shape
+        image_embeds = _fused_class_multiply_ln(
+            image_embeds,
+            self.post_post_layernorm.weight,
+            self.post_post_layernorm.bias,
+            self.post_post_layernorm_eps,
         )
+
+        side = isqrt(s - 1)
+        new_size = (b, side, side, d)
         image_embeds = image_embeds.reshape(new_size)
 
         return image_embeds
@@ -93,24 +122,35 @@ class OwlViT(torch.nn.Module):
 
 
 class PostProcess:
-    def __init__(self, confidence_threshold=0.75, iou_threshold=0.3):
+    def __init__(
+        self, confidence_threshold=0.75, iou_threshold=0.3, max_candidates=None
+    ):
         self.confidence_threshold = confidence_threshold
         self.iou_threshold = iou_threshold
+        self.max_candidates = max_candidates
 
     def __call__(self, all_pred_boxes, pred_classes):
         # Just support batch size of one for now
         pred_boxes = all_pred_boxes.squeeze(0)
         pred_classes = pred_classes.squeeze(0)
-        pred_classes = torch.nn.functional.softmax(pred_classes, dim=1)[:, :-1]
 
-        top = torch.max(pred_classes, dim=1)
-        scores = top.values
-        classes = top.indices
-
-        idx = scores > self.confidence_threshold
-        scores = scores[idx]
-        classes = classes[idx]
-        pred_boxes = pred_boxes[idx]
+        # softmax is monotonic so the best class can be taken from the logits,
+        # then only its probability needs computing (the last column is background)
+        logits = pred_classes[:, :-1]
+        classes = logits.argmax(dim=1)
+        max_logits = logits.gather(1, classes[:, None]).squeeze(1)
+        scores = (max_logits - torch.logsumexp(pred_classes, dim=1)).exp()
+
+        # Resolve the mask to indices once rather than once per tensor
+        keep = (scores > self.confidence_threshold).nonzero(as_tuple=True)[0]
+        scores, classes, pred_boxes = scores[keep], classes[keep], pred_boxes[keep]
+
+        # nms is quadratic in the number of boxes, so optionally only keep the
+        # best few hundred. This changes which boxes survive nms, so it's off
+        # by default
+        if self.max_candidates is not None:
+            scores, order = scores.topk(min(scores.numel(), self.max_candidates))
+            classes, pred_boxes = classes[order], pred_boxes[order]
 
         idx = batched_nms(pred_boxes, scores, classes, iou_threshold=self.iou_threshold)
         classes = classes[idx]
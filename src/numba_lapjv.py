@@ -0,0 +1,163 @@
+"""
+Numba port of the shortest augmenting path (Jonker-Volgenant style) solver
+in scipy's _lsap.c (https://github.com/scipy/scipy/blob/main/scipy/optimize/_lsap.c)
+
+For the small matrices the matcher produces most of scipy's time goes to
+argument checking and call overhead rather than the solve itself.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+available = njit is not None
+
+# fastmath=True implies no infs, which the solver relies on, so leave out ninf/nnan
+_FASTMATH = {"nsz", "arcp", "contract", "afn", "reassoc"}
+
+
+def _jit(fn):
+    if njit is None:
+        return fn
+    return njit(cache=True, fastmath=_FASTMATH)(fn)
+
+
+@_jit
+def _augmenting_path(
+    cost, u, v, path, row4col, shortest_path_costs, i, SR, SC, remaining
+):
+    nc = cost.shape[1]
+    min_val = 0.0
+
+    # Filling this up in reverse order ensures that the solution of a
+    # constant cost matrix is the identity matrix
+    num_remaining = nc
+    for it in range(nc):
+        remaining[it] = nc - it - 1
+
+    SR[:] = False
+    SC[:] = False
+    shortest_path_costs[:] = np.inf
+
+    # find shortest augmenting path
+    sink = -1
+    while sink == -1:
+        index = -1
+        lowest = np.inf
+        SR[i] = True
+
+        for it in range(num_remaining):
+            j = remaining[it]
+            r = min_val + cost[i, j] - u[i] - v[j]
+            if r < shortest_path_costs[j]:
+                path[j] = i
+                shortest_path_costs[j] = r
+
+            # When multiple nodes have the minimum cost, we select one which
+            # gives us a new sink node
+            if shortest_path_costs[j] < lowest or (
+                shortest_path_costs[j] == lowest and row4col[j] == -1
+            ):
+                lowest = shortest_path_costs[j]
+                index = it
+
+        min_val = lowest
+        if min_val == np.inf:  # infeasible cost matrix
+            return -1, min_val
+
+        j = remaining[index]
+        if row4col[j] == -1:
+            sink = j
+        else:
+            i = row4col[j]
+
+        SC[j] = True
+        num_remaining -= 1
+        remaining[index] = remaining[num_remaining]
+
+    return sink, min_val
+
+
+@_jit
+def _solve(cost):
+    # cost must have nr <= nc
+    nr, nc = cost.shape
+
+    u = np.zeros(nr)
+    v = np.zeros(nc)
+    shortest_path_costs = np.empty(nc)
+    path = np.full(nc, -1, dtype=np.int64)
+    col4row = np.full(nr, -1, dtype=np.int64)
+    row4col = np.full(nc, -1, dtype=np.int64)
+    SR = np.zeros(nr, dtype=np.bool_)
+    SC = np.zeros(nc, dtype=np.bool_)
+    remaining = np.empty(nc, dtype=np.int64)
+
+    # iteratively build the solution
+    for cur_row in range(nr):
+        sink, min_val = _augmenting_path(
+            cost, u, v, path, row4col, shortest_path_costs, cur_row, SR, SC, remaining
+        )
+        if sink < 0:
+            raise ValueError("cost matrix is infeasible")
+
+        # update dual variables
+        u[cur_row] += min_val
+        for i in range(nr):
+            if SR[i] and i != cur_row:
+                u[i] += min_val - shortest_path_costs[col4row[i]]
+
+        for j in range(nc):
+            if SC[j]:
+                v[j] -= min_val - shortest_path_costs[j]
+
+        # augment previous solution
+        j = sink
+        while True:
+            i = path[j]
+            row4col[j] = i
+            tmp = col4row[i]
+            col4row[i] = j
+            j = tmp
+            if i == cur_row:
+                break
+
+    return col4row
+
+
+def linear_sum_assignment(cost):
+    """
+    Drop-in for scipy.optimize.linear_sum_assignment on a 2d float cost
+    matrix (minimization only). Returns (row_ind, col_ind) with row_ind sorted.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    nr, nc = cost.shape
+
+    if nr == 0 or nc == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+
+    # Same check as scipy, +inf is allowed as long as an assignment exists.
+    # min propagates nan, so one reduction covers both
+    lowest = cost.min()
+    if np.isnan(lowest) or lowest == -np.inf:
+        raise ValueError("matrix contains invalid numeric entries")
+
+    # The solver wants at least as many columns as rows. numba handles the
+    # strided transpose directly, so there's no copy
+    if nr <= nc:
+        return np.arange(nr), _solve(cost)
+
+    row_ind = _solve(cost.T)
+    order = np.argsort(row_ind)
+    return row_ind[order], order
+
+
+# Compile (or load from the on-disk cache) at import rather than on the first match,
+# for both the contiguous and the transposed layouts
+if available:
+    linear_sum_assignment(np.zeros((2, 2)))
+    linear_sum_assignment(np.zeros((3, 2)))